@@ -1,9 +1,60 @@
 """
 API client for similarity service
 """
+from collections import OrderedDict
+from functools import lru_cache
+import time
+import traceback
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
-from config import SIMILARITY_API_URL, TOP_N_RESULTS, API_TIMEOUT
+import numpy as np
+from config import (
+    SIMILARITY_API_URL,
+    TOP_N_RESULTS,
+    API_TIMEOUT,
+    API_CONNECT_TIMEOUT,
+    HEALTH_CHECK_CONNECT_TIMEOUT,
+    HEALTH_CHECK_TIMEOUT,
+    HEALTH_CHECK_TTL,
+    SIMILARITY_CACHE_SIZE
+)
+
+
+@lru_cache(maxsize=32)
+def error_frame(message):
+    """
+    Get a one-cell DataFrame carrying an error message
+
+    Frames are cached per message and shared, so callers must not modify them.
+    """
+    return pd.DataFrame({"Error": [message]})
+
+
+API_DOWN_ERROR = error_frame(
+    "Similarity API is not running. Please start the API server.")
+
+
+def create_session():
+    """
+    Create a pooled HTTP session for talking to the similarity API
+
+    Keep-alive connections are reused instead of paying a new TCP handshake
+    for every request.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Connection": "keep-alive"
+    })
+    return session
+
+
+SESSION = create_session()
 
 
 class SimilarityAPIClient:
@@ -12,18 +63,45 @@ class SimilarityAPIClient:
     def __init__(self, api_url=SIMILARITY_API_URL):
         self.api_url = api_url
 
+        # Shared process-wide session, so connections are reused across calls
+        # and across dashboard sessions
+        self._session = SESSION
+
+        # Last serialized weights, as (weights dict copy, JSON bytes)
+        self._weights_cache = (None, b"")
+
+        # LRU of successful results keyed by (product_id, top_n, weights)
+        self._similar_cache = OrderedDict()
+
+        # Last health check as (monotonic timestamp, result)
+        self._last_health = (None, False)
+
     def check_health(self):
         """
         Check if similarity API is running
 
+        The result is reused for HEALTH_CHECK_TTL seconds so repeated
+        renders don't each probe the API.
+
         Returns:
             bool: True if API is accessible, False otherwise
         """
+        checked_at, healthy = self._last_health
+        now = time.monotonic()
+        if checked_at is not None and now - checked_at < HEALTH_CHECK_TTL:
+            return healthy
+
         try:
-            response = requests.get(f"{self.api_url}/", timeout=2)
-            return response.status_code == 200
+            response = self._session.get(
+                f"{self.api_url}/",
+                timeout=(HEALTH_CHECK_CONNECT_TIMEOUT, HEALTH_CHECK_TIMEOUT)
+            )
+            healthy = response.status_code == 200
         except:
-            return False
+            healthy = False
+
+        self._last_health = (now, healthy)
+        return healthy
 
     def get_similar_products(self, product_id, weights, top_n=TOP_N_RESULTS):
         """
@@ -37,70 +115,159 @@ class SimilarityAPIClient:
         Returns:
             tuple: (success: bool, result: DataFrame or error message)
         """
+        cache_key = (int(product_id), int(top_n), tuple(sorted(weights.items())))
+        cached = self._similar_cache.get(cache_key)
+        if cached is not None:
+            self._similar_cache.move_to_end(cache_key)
+            print(f"✅ Using cached similar products for ID {product_id}")
+            return True, cached
+
         try:
-            # Check API health first
-            if not self.check_health():
-                error_df = pd.DataFrame({
-                    "Error": ["Similarity API is not running. Please start the API server."]
-                })
+            # Prepare request payload (weights are serialized once and reused)
+            body = (
+                b'{"product_id":' + str(int(product_id)).encode() +
+                b',"top_n":' + str(int(top_n)).encode() +
+                b',"weights":' + self._encode_weights(weights) + b'}'
+            )
+
+            # Make API request - a failed connection means the API is down,
+            # so no separate health check is needed beforehand
+            try:
+                response = self._session.post(
+                    f"{self.api_url}/similar",
+                    data=body,
+                    timeout=(API_CONNECT_TIMEOUT, API_TIMEOUT)
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                print(f"❌ Similarity API not reachable: {str(e)}")
+                return False, API_DOWN_ERROR
+
+            if response.status_code == 200:
+                data = orjson.loads(response.content)
+
+                # Convert API response to DataFrame
+                result_df = self._results_to_dataframe(
+                    data['similar_products'])
+
+                print(
+                    f"✅ Found {len(result_df)} similar products for ID {product_id}")
+                print(f"   Computation time: {data['computation_time_ms']} ms")
+
+                self._similar_cache[cache_key] = result_df
+                if len(self._similar_cache) > SIMILARITY_CACHE_SIZE:
+                    self._similar_cache.popitem(last=False)
+
+                return True, result_df
+            else:
+                error_msg = orjson.loads(response.content).get('error', 'Unknown error')
+                error_df = error_frame(f"API returned error: {error_msg}")
+                print(f"❌ API error: {response.status_code}")
                 return False, error_df
 
-            # Prepare request payload
+        except Exception as e:
+            print(f"❌ Error computing similarity: {str(e)}")
+            traceback.print_exc()
+
+            return False, error_frame(f"Error: {str(e)}")
+
+    def get_similar_products_batch(self, product_ids, weights, top_n=TOP_N_RESULTS):
+        """
+        Get similar products for several products in one API request
+
+        Args:
+            product_ids: List of product IDs to find similarities for
+            weights: Dictionary with keys 'text', 'nutrition', 'brand', 'barcode'
+            top_n: Number of similar products to return per product
+
+        Returns:
+            tuple: (success: bool, result: dict of {product_id: DataFrame} or error DataFrame)
+        """
+        try:
             payload = {
-                "product_id": product_id,
-                "top_n": top_n,
+                "items": [{"product_id": pid, "top_n": top_n} for pid in product_ids],
                 "weights": weights
             }
 
-            # Make API request
-            response = requests.post(
-                f"{self.api_url}/similar",
-                json=payload,
-                timeout=API_TIMEOUT
-            )
+            try:
+                response = self._session.post(
+                    f"{self.api_url}/batch",
+                    data=orjson.dumps(payload),
+                    timeout=(API_CONNECT_TIMEOUT, API_TIMEOUT)
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                print(f"❌ Similarity API not reachable: {str(e)}")
+                return False, API_DOWN_ERROR
 
             if response.status_code == 200:
-                data = response.json()
+                data = orjson.loads(response.content)
 
-                # Convert API response to DataFrame
-                similar_prods = data['similar_products']
-                result_df = pd.DataFrame([
-                    {
-                        'Rank': p['rank'],
-                        'Name': p['name'],
-                        'Brand': p['brand'],
-                        'Barcode': p.get('barcode', 'N/A'),
-                        'Active': 'Yes' if p.get('active', 0) == 1 else 'No',
-                        'Score': f"{p['similarity_score']:.4f}",
-                        'Energy': p['nutrition']['energy'],
-                        'Protein': p['nutrition']['protein'],
-                        'Fat': p['nutrition']['fat']
-                    }
-                    for p in similar_prods
-                ])
-
-                # Store the IDs separately for later use
-                result_df['_id'] = [p['id'] for p in similar_prods]
+                results = {}
+                for item in data['results']:
+                    if 'error' in item:
+                        results[item['product_id']] = error_frame(
+                            f"API returned error: {item['error']}")
+                    else:
+                        results[item['product_id']] = self._results_to_dataframe(
+                            item['similar_products'])
 
                 print(
-                    f"✅ Found {len(result_df)} similar products for ID {product_id}")
+                    f"✅ Computed similarity for {len(results)} products in one batch")
                 print(f"   Computation time: {data['computation_time_ms']} ms")
 
-                return True, result_df
+                return True, results
             else:
-                error_msg = response.json().get('error', 'Unknown error')
-                error_df = pd.DataFrame({
-                    "Error": [f"API returned error: {error_msg}"]
-                })
+                error_msg = orjson.loads(response.content).get('error', 'Unknown error')
+                error_df = error_frame(f"API returned error: {error_msg}")
                 print(f"❌ API error: {response.status_code}")
                 return False, error_df
 
         except Exception as e:
-            print(f"❌ Error computing similarity: {str(e)}")
-            import traceback
+            print(f"❌ Error computing batch similarity: {str(e)}")
             traceback.print_exc()
 
-            error_df = pd.DataFrame({
-                "Error": [f"Error: {str(e)}"]
-            })
-            return False, error_df
+            return False, error_frame(f"Error: {str(e)}")
+
+    def _encode_weights(self, weights):
+        """Serialize the weights dict, reusing the bytes while it is unchanged"""
+        cached_weights, cached_bytes = self._weights_cache
+        if cached_weights != weights:
+            cached_bytes = orjson.dumps(weights)
+            self._weights_cache = (dict(weights), cached_bytes)
+        return cached_bytes
+
+    @staticmethod
+    def _results_to_dataframe(similar_prods):
+        """Build the results DataFrame for a list of similar products"""
+        columns = ['Rank', 'Name', 'Brand', 'Barcode', 'Active',
+                   'Score', 'Energy', 'Protein', 'Fat', '_id']
+        if not similar_prods:
+            return pd.DataFrame(columns=columns)
+
+        # Extract each column as one typed array instead of inferring row dicts
+        nutrition = [p['nutrition'] for p in similar_prods]
+        active = np.array([p.get('active') or 0 for p in similar_prods], dtype=np.int8)
+
+        return pd.DataFrame({
+            'Rank': [p['rank'] for p in similar_prods],
+            'Name': [p['name'] for p in similar_prods],
+            'Brand': [p['brand'] for p in similar_prods],
+            'Barcode': ['N/A' if p.get('barcode') is None else p['barcode']
+                        for p in similar_prods],
+            'Active': np.where(active == 1, 'Yes', 'No'),
+            # Kept numeric; formatting happens when the results are rendered
+            'Score': np.array([p['similarity_score'] for p in similar_prods], dtype=float),
+            # None (missing nutrition values) becomes NaN in float arrays
+            'Energy': np.array([n.get('energy') for n in nutrition], dtype=float),
+            'Protein': np.array([n.get('protein') for n in nutrition], dtype=float),
+            'Fat': np.array([n.get('fat') for n in nutrition], dtype=float),
+            # Store the IDs separately for later use
+            '_id': [p['id'] for p in similar_prods]
+        }, columns=columns)
+
+    def clear_cache(self):
+        """Forget all cached similarity results"""
+        self._similar_cache.clear()
+
+    def close(self):
+        """Release this client's state (the shared HTTP session stays open)"""
+        self._similar_cache.clear()
@@ -1,6 +1,7 @@
 """
 Configuration settings for the Food Product Similarity Dashboard
 """
+import os
 
 # API Configuration
 SIMILARITY_API_URL = "http://localhost:5000"
@@ -8,6 +9,17 @@ SIMILARITY_API_URL = "http://localhost:5000"
 # Database Configuration
 DATABASE_PATH = ":memory:"
 CSV_FILENAME = "view_food_clean.csv"
+# Columnar copy of the CSV, generated on first load and reused afterwards
+PARQUET_FILENAME = "view_food_clean.parquet"
+# DuckDB resource caps (per dashboard session). Half the cores by default,
+# leaving the rest for the Shiny workers; override with DUCKDB_THREADS.
+DUCKDB_THREADS = int(os.environ.get(
+    "DUCKDB_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+DUCKDB_MEMORY_LIMIT = "1GB"
+# Number of filtered product queries kept until the next write
+FILTER_CACHE_SIZE = 32
+# Print the affected rows after linking/activating products (extra query per write)
+DEBUG_DATABASE_WRITES = False
 
 # App Configuration
 APP_HOST = "127.0.0.1"
@@ -30,6 +42,14 @@ WEIGHT_SLIDER_CONFIG = {
 # Similarity Configuration
 TOP_N_RESULTS = 20
 API_TIMEOUT = 30
+# Connect timeouts are kept short so an API that is down is detected quickly
+API_CONNECT_TIMEOUT = 0.5
+HEALTH_CHECK_CONNECT_TIMEOUT = 0.2
+HEALTH_CHECK_TIMEOUT = 2
+# Seconds a health check result is reused before probing the API again
+HEALTH_CHECK_TTL = 5
+# Number of (product, weights) similarity results kept in memory
+SIMILARITY_CACHE_SIZE = 256
 
 # Editor Configuration - fields that can be edited
 EDITABLE_FIELDS = [
@@ -44,6 +64,17 @@ EDITABLE_FIELDS = [
     "salt"
 ]
 
+# Columns shown in the product tables (default projection of filtered queries)
+DISPLAY_COLUMNS = [
+    "id",
+    "name_search",
+    "brands_search",
+    "barcode",
+    "energy",
+    "protein",
+    "fat"
+]
+
 # Fields to display in comparison view
 COMPARISON_FIELDS = [
     "id",
@@ -71,3 +102,17 @@ NUTRITION_FIELDS = [
     "sugar",
     "salt"
 ]
+
+# Column types of the source CSV, so it is parsed without type inference.
+# Barcodes stay text (leading zeros, ';'-joined lists after linking).
+CSV_COLUMN_TYPES = {
+    "id": "BIGINT",
+    "name_search": "VARCHAR",
+    "brands_search": "VARCHAR",
+    "categories": "VARCHAR",
+    "barcode": "VARCHAR",
+    **{field: "DOUBLE" for field in NUTRITION_FIELDS},
+    "active": "INTEGER",
+    "deleted": "VARCHAR",
+    "linked_items": "VARCHAR"
+}
@@ -4,62 +4,275 @@ Database operations for the Food Product Similarity Dashboard
 import duckdb
 import pandas as pd
 import os
+import tempfile
+import traceback
+from collections import OrderedDict
 from datetime import datetime
-from config import DATABASE_PATH, CSV_FILENAME, COMPARISON_FIELDS
+from config import (
+    DATABASE_PATH,
+    CSV_FILENAME,
+    PARQUET_FILENAME,
+    DUCKDB_THREADS,
+    DUCKDB_MEMORY_LIMIT,
+    FILTER_CACHE_SIZE,
+    DISPLAY_COLUMNS,
+    DEBUG_DATABASE_WRITES,
+    CSV_COLUMN_TYPES,
+    COMPARISON_FIELDS
+)
+
+# Data file locations, resolved once at import time
+BASE_DIR = os.path.dirname(__file__)
+CSV_PATH = os.path.join(BASE_DIR, CSV_FILENAME)
+PARQUET_PATH = os.path.join(BASE_DIR, PARQUET_FILENAME)
+
+# Searchable columns and the lowercase copies the search filter matches against
+SEARCH_COLUMNS = {
+    'name_search': 'name_lc',
+    'brands_search': 'brands_lc'
+}
+# Clause that keeps the lowercase copies out of SELECT * results
+EXCLUDE_SEARCH_COLUMNS = f"EXCLUDE ({', '.join(SEARCH_COLUMNS.values())})"
+
+
+def sql_path(path):
+    """Escape a file path for use inside a SQL string literal"""
+    return path.replace("'", "''")
+
+
+def search_column_select(source_columns):
+    """
+    Build the SELECT expressions for the lowercase search columns
+
+    Args:
+        source_columns: Column names available in the source
+
+    Returns:
+        str: Comma-separated expressions, NULL for missing source columns
+    """
+    return ", ".join(
+        f"LOWER({column}) AS {lc_column}" if column in source_columns
+        else f"CAST(NULL AS VARCHAR) AS {lc_column}"
+        for column, lc_column in SEARCH_COLUMNS.items()
+    )
+
+
+def as_int(value):
+    """Convert a product ID (Python or numpy integer) to a Python int"""
+    return value.item() if hasattr(value, 'item') else int(value)
+
+
+def parquet_is_current(con, csv_path, parquet_path):
+    """
+    Check whether the Parquet copy can be used instead of the CSV
+
+    Args:
+        con: DuckDB connection used to read the Parquet schema
+        csv_path: Path of the source CSV file
+        parquet_path: Path of the Parquet file
+
+    Returns:
+        bool: False if the file is missing, older than the CSV, unreadable,
+        or stores a known column with a type other than CSV_COLUMN_TYPES
+    """
+    if not os.path.exists(parquet_path):
+        return False
+    if os.path.getmtime(parquet_path) < os.path.getmtime(csv_path):
+        return False
+    try:
+        schema = con.execute(
+            f"DESCRIBE SELECT * FROM read_parquet('{sql_path(parquet_path)}')"
+        ).fetchall()
+    except duckdb.Error as e:
+        print(f"Unreadable Parquet file {parquet_path}, rebuilding: {e}")
+        return False
+
+    # A file built with older or inferred types (e.g. numeric barcodes) is stale
+    for col, col_type in ((row[0], row[1]) for row in schema):
+        expected = CSV_COLUMN_TYPES.get(col)
+        if expected is not None and col_type != expected:
+            print(f"Parquet column '{col}' is {col_type}, expected {expected}, rebuilding")
+            return False
+    return True
+
+
+def csv_source(con, csv_path):
+    """
+    Build the SQL table expression that reads the CSV with its known column types
+
+    Known columns are read as text and converted with TRY_CAST, so a cell that
+    does not fit its type (e.g. 'n/a' in a nutrition column) becomes NULL
+    instead of aborting the whole load.
+
+    Args:
+        con: DuckDB connection used to list the CSV columns
+        csv_path: Path of the source CSV file
+
+    Returns:
+        str: Subquery for use in a FROM clause
+    """
+    # Sniffing the start of the file is enough to list its columns
+    csv_columns = [
+        col[0] for col in con.execute(
+            f"DESCRIBE SELECT * FROM read_csv_auto('{sql_path(csv_path)}', HEADER=TRUE)"
+        ).fetchall()
+    ]
+    known_columns = {col: col_type for col, col_type in CSV_COLUMN_TYPES.items()
+                     if col in csv_columns}
+
+    # Unknown columns still need a full scan to infer their types safely
+    options = "HEADER=TRUE"
+    if known_columns:
+        types = ", ".join(f"'{col}': 'VARCHAR'" for col in known_columns)
+        options += f", TYPES={{{types}}}"
+    if any(col not in CSV_COLUMN_TYPES for col in csv_columns):
+        options += ", SAMPLE_SIZE=-1"
+
+    select = "*"
+    casts = ", ".join(f"TRY_CAST({col} AS {col_type}) AS {col}"
+                      for col, col_type in known_columns.items()
+                      if col_type != "VARCHAR")
+    if casts:
+        select += f" REPLACE ({casts})"
+
+    return f"(SELECT {select} FROM read_csv_auto('{sql_path(csv_path)}', {options}))"
+
+
+def ensure_parquet(con, csv_path, parquet_path):
+    """
+    Convert the CSV to Parquet once, so later startups skip CSV parsing
+
+    The Parquet file is rebuilt whenever the CSV is newer than it or it
+    cannot be read. It is written to a temporary file first and then moved
+    into place, so concurrent or interrupted conversions never leave a
+    partial file behind.
+
+    Args:
+        con: DuckDB connection used for the conversion
+        csv_path: Path of the source CSV file
+        parquet_path: Path of the Parquet file to create
+
+    Returns:
+        bool: True if the Parquet file can be used, False if it could not be
+        written (e.g. read-only directory or full disk)
+    """
+    if not os.path.exists(csv_path):
+        return os.path.exists(parquet_path)
+    if parquet_is_current(con, csv_path, parquet_path):
+        return True
+
+    print(f"Converting CSV to Parquet: {csv_path} -> {parquet_path}")
+    source = csv_source(con, csv_path)
+
+    tmp_path = None
+    try:
+        # Unique temporary file in the same directory, so os.replace is atomic
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=os.path.basename(parquet_path) + ".",
+            suffix=".tmp",
+            dir=os.path.dirname(parquet_path) or "."
+        )
+        os.close(fd)
+        con.execute(f"""
+            COPY (SELECT * FROM {source})
+            TO '{sql_path(tmp_path)}' (FORMAT PARQUET, COMPRESSION ZSTD)
+        """)
+        os.replace(tmp_path, parquet_path)
+    except (OSError, duckdb.Error) as e:
+        print(f"Could not write Parquet file {parquet_path}: {e}")
+        return False
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+
+def product_source(con, csv_path, parquet_path):
+    """
+    Get the SQL table expression to load the products from
+
+    Uses the Parquet copy (creating it if needed) and falls back to reading
+    the CSV directly when the copy cannot be written.
+
+    Args:
+        con: DuckDB connection used for the conversion
+        csv_path: Path of the source CSV file
+        parquet_path: Path of the Parquet file
+
+    Returns:
+        str: Table function call for use in a FROM clause
+    """
+    if ensure_parquet(con, csv_path, parquet_path):
+        print(f"Loading Parquet from: {parquet_path}")
+        return f"read_parquet('{sql_path(parquet_path)}')"
+
+    print(f"Loading CSV from: {csv_path}")
+    return csv_source(con, csv_path)
 
 
 class DatabaseManager:
     """Manages DuckDB connection and operations"""
 
     def __init__(self):
-        self.con = duckdb.connect(database=DATABASE_PATH)
+        self.con = duckdb.connect(
+            database=DATABASE_PATH,
+            config={
+                "threads": DUCKDB_THREADS,
+                "memory_limit": DUCKDB_MEMORY_LIMIT
+            }
+        )
+        # Filtered query results, reused until the products table is written
+        self._filter_cache = OrderedDict()
         self._initialize_database()
 
     def _initialize_database(self):
         """Load CSV data into DuckDB or create sample data"""
-        csv_path = os.path.join(os.path.dirname(__file__), CSV_FILENAME)
+        csv_path = CSV_PATH
+        parquet_path = PARQUET_PATH
 
         try:
-            if os.path.exists(csv_path):
-                print(f"Loading CSV from: {csv_path}")
-                df_temp = pd.read_csv(csv_path, low_memory=False)
-
-                # Filter out deleted products (keep only where deleted is NaN/empty)
-                if 'deleted' in df_temp.columns:
-                    df_temp = df_temp[df_temp["deleted"].isna()]
-
-                # Drop the deleted column - we'll recreate it with correct type
-                if 'deleted' in df_temp.columns:
-                    df_temp = df_temp.drop(columns=['deleted'])
-
-                # Drop linked_items if it exists - we'll create it fresh
-                if 'linked_items' in df_temp.columns:
-                    df_temp = df_temp.drop(columns=['linked_items'])
-
-                print(f"Loaded {len(df_temp)} rows from CSV")
-                self.con.execute(
-                    "CREATE TABLE products AS SELECT * FROM df_temp")
-
-                # Add deleted column as VARCHAR
-                self.con.execute(
-                    "ALTER TABLE products ADD COLUMN deleted VARCHAR")
-                print("Added 'deleted' column as VARCHAR")
-
-                # Add linked_items column as VARCHAR
-                self.con.execute(
-                    "ALTER TABLE products ADD COLUMN linked_items VARCHAR")
-                print("Added 'linked_items' column as VARCHAR")
-
-                # Ensure active column is INTEGER (CSV might load it as float or string)
-                self.con.execute(
-                    "UPDATE products SET active = CAST(active AS INTEGER)")
-                print("Ensured 'active' column is INTEGER type")
-
-                # Verify column types
-                schema = self.con.execute("DESCRIBE products").fetchall()
-                for col in schema:
-                    if col[0] in ['deleted', 'linked_items', 'active']:
-                        print(f"  Column '{col[0]}' type: {col[1]}")
+            if os.path.exists(csv_path) or os.path.exists(parquet_path):
+                source = product_source(self.con, csv_path, parquet_path)
+                source_columns = [
+                    col[0] for col in
+                    self.con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()
+                ]
+
+                # Filter out deleted products (keep only where deleted is NULL/empty)
+                where_clause = "WHERE deleted IS NULL" if 'deleted' in source_columns else ""
+
+                # Drop deleted and linked_items - they are recreated as empty VARCHAR columns.
+                # Ensure active is INTEGER (CSV might load it as float or string).
+                # Everything happens in one CREATE TABLE so the data is copied only once.
+                dropped = [col for col in ('deleted', 'linked_items')
+                           if col in source_columns]
+                select = "*"
+                if dropped:
+                    select += f" EXCLUDE ({', '.join(dropped)})"
+                if 'active' in source_columns:
+                    select += " REPLACE (CAST(active AS INTEGER) AS active)"
+
+                # Store rows grouped by active status, so the per-status table
+                # queries can skip whole row groups using DuckDB's min/max zonemaps
+                order_by = ", ".join(col for col in ('active', 'id')
+                                     if col in source_columns)
+                order_clause = f"ORDER BY {order_by}" if order_by else ""
+
+                self.con.execute(f"""
+                    CREATE TABLE products AS
+                    SELECT {select},
+                           CAST(NULL AS VARCHAR) AS deleted,
+                           CAST(NULL AS VARCHAR) AS linked_items,
+                           {search_column_select(source_columns)}
+                    FROM {source} {where_clause}
+                    {order_clause}
+                """)
+                print("Created 'deleted' and 'linked_items' columns as VARCHAR")
+
+                # Index for the single-product lookups and updates by id
+                if 'id' in source_columns:
+                    self.con.execute(
+                        "CREATE INDEX idx_products_id ON products (id)")
 
                 result = self.con.execute(
                     "SELECT COUNT(*) as count FROM products").fetchone()
@@ -69,15 +282,14 @@ class DatabaseManager:
                 self._create_sample_data()
         except Exception as e:
             print(f"Error loading data: {str(e)}")
-            import traceback
             traceback.print_exc()
             self._create_empty_table()
 
     def _create_sample_data(self):
         """Create sample products table"""
-        self.con.execute("""
-            CREATE TABLE products AS 
-            SELECT * FROM (VALUES
+        self.con.execute(f"""
+            CREATE TABLE products AS
+            SELECT *, {search_column_select(SEARCH_COLUMNS)} FROM (VALUES
                 (1, 'Apple Juice', 'FruitCo', 'Beverage', '123456', 45, 0.2, 0.0, 0.0, 10.5, 9.0, 0.01, 1, NULL, NULL),
                 (2, 'Orange Juice', 'FruitCo', 'Beverage', '123457', 50, 0.3, 0.1, 0.0, 11.0, 10.0, 0.02, 0, NULL, NULL),
                 (3, 'Tomato Soup', 'SoupBrand', 'Soup', '234567', 80, 2.0, 3.5, 0.5, 8.0, 5.0, 0.8, 0, NULL, NULL)
@@ -103,11 +315,47 @@ class DatabaseManager:
                 salt DOUBLE,
                 active INTEGER,
                 deleted VARCHAR,
-                linked_items VARCHAR
+                linked_items VARCHAR,
+                name_lc VARCHAR,
+                brands_lc VARCHAR
             )
         """)
         print("Created empty products table due to error")
 
+    def _build_filter_clause(self, active_filter, search_term=""):
+        """
+        Build the WHERE clause shared by the filtered product queries
+
+        Args:
+            active_filter: "all", "1" (active), or "0" (inactive)
+            search_term: Optional search term for name or brand
+
+        Returns:
+            tuple: (SQL condition string, list of parameters to bind)
+        """
+        # Exclude deleted products and products linked to others
+        # Empty CSV values can be NULL or empty string depending on how pandas reads them
+        conditions = [
+            "(deleted IS NULL OR deleted = '')",
+            "(linked_items IS NULL OR linked_items = '')"
+        ]
+
+        if active_filter == "1":
+            conditions.append("CAST(active AS INTEGER) = 1")
+        elif active_filter == "0":
+            conditions.append("CAST(active AS INTEGER) = 0")
+
+        params = []
+        if search_term:
+            # Bound as parameters so the term is never spliced into the SQL.
+            # contains() is a plain substring match, so '%' and '_' typed in
+            # the search box match literally.
+            conditions.append("(contains(name_lc, ?) OR contains(brands_lc, ?))")
+            term = search_term.lower()
+            params.extend([term, term])
+
+        return (" AND ".join(conditions) if conditions else "1=1"), params
+
     def get_filtered_products(self, active_filter, search_term="", columns=None):
         """
         Get products filtered by active status and search term
@@ -115,49 +363,41 @@ class DatabaseManager:
         Args:
             active_filter: "all", "1" (active), or "0" (inactive)
             search_term: Optional search term for name or brand
-            columns: Optional list of columns to select
+            columns: Optional list of columns to select (defaults to DISPLAY_COLUMNS)
 
         Returns:
-            pandas DataFrame with filtered products
+            pandas DataFrame with filtered products (shared between callers,
+            do not modify in place)
         """
+        columns = columns or DISPLAY_COLUMNS
+        cache_key = (active_filter, search_term, tuple(columns))
+        cached = self._filter_cache.get(cache_key)
+        if cached is not None:
+            self._filter_cache.move_to_end(cache_key)
+            return cached
+
         try:
             # Build column selection
-            if columns:
-                col_str = ", ".join(columns)
-            else:
-                col_str = "*"
+            col_str = ", ".join(columns)
 
-            # Build WHERE clause - exclude deleted products and products linked to others
-            # Empty CSV values can be NULL or empty string depending on how pandas reads them
-            conditions = [
-                "(deleted IS NULL OR deleted = '')",
-                "(linked_items IS NULL OR linked_items = '')"
-            ]
-
-            if active_filter == "1":
-                conditions.append("CAST(active AS INTEGER) = 1")
-            elif active_filter == "0":
-                conditions.append("CAST(active AS INTEGER) = 0")
-
-            if search_term:
-                conditions.append(
-                    f"(LOWER(name_search) LIKE '%{search_term.lower()}%' OR "
-                    f"LOWER(brands_search) LIKE '%{search_term.lower()}%')"
-                )
-
-            where_clause = " AND ".join(conditions) if conditions else "1=1"
+            where_clause, params = self._build_filter_clause(
+                active_filter, search_term)
             query = f"SELECT {col_str} FROM products WHERE {where_clause}"
 
-            result = self.con.execute(query).df().reset_index(drop=True)
+            # DuckDB already returns a fresh RangeIndex, so no reset_index copy is needed
+            result = self.con.execute(query, params).df()
 
             # Debug: Print query results for troubleshooting
             print(
                 f"DEBUG get_filtered_products: active_filter={active_filter}, returned {len(result)} rows")
 
+            self._filter_cache[cache_key] = result
+            if len(self._filter_cache) > FILTER_CACHE_SIZE:
+                self._filter_cache.popitem(last=False)
+
             return result
         except Exception as e:
             print(f"Error filtering data: {str(e)}")
-            import traceback
             traceback.print_exc()
             return pd.DataFrame()
 
@@ -173,29 +413,30 @@ class DatabaseManager:
         """
         try:
             # Convert numpy int64 to Python int if necessary
-            if hasattr(product_id, 'item'):
-                product_id = product_id.item()
-            else:
-                product_id = int(product_id)
+            product_id = as_int(product_id)
 
-            result = self.con.execute(
-                "SELECT * FROM products WHERE id = ?",
+            # Fetch the raw row instead of building a one-row DataFrame
+            cursor = self.con.execute(
+                f"SELECT * {EXCLUDE_SEARCH_COLUMNS} FROM products WHERE id = ?",
                 [product_id]
-            ).df()
+            )
+            row = cursor.fetchone()
 
-            if len(result) > 0:
-                return result.iloc[0]
+            if row is not None:
+                columns = [desc[0] for desc in cursor.description]
+                return pd.Series(row, index=columns)
             return None
         except Exception as e:
             print(f"Error getting product {product_id}: {str(e)}")
             return None
 
-    def get_products_by_ids(self, product_ids):
+    def get_products_by_ids(self, product_ids, columns=None):
         """
         Get multiple products by their IDs
 
         Args:
             product_ids: List of product IDs to retrieve
+            columns: Optional list of columns to select
 
         Returns:
             pandas DataFrame with product data
@@ -204,14 +445,17 @@ class DatabaseManager:
             if not product_ids:
                 return pd.DataFrame()
 
+            # Build column selection
+            col_str = ", ".join(columns) if columns else f"* {EXCLUDE_SEARCH_COLUMNS}"
+
             # Convert to Python ints
-            ids = [int(pid) if hasattr(pid, 'item') else int(pid)
-                   for pid in product_ids]
-            placeholders = ", ".join(["?" for _ in ids])
+            ids = [as_int(pid) for pid in product_ids]
 
+            # Bind the whole list as one parameter so the SQL text is the same
+            # for any number of ids
             result = self.con.execute(
-                f"SELECT * FROM products WHERE id IN ({placeholders})",
-                ids
+                f"SELECT {col_str} FROM products WHERE id = ANY(?)",
+                [ids]
             ).df()
 
             return result
@@ -235,10 +479,7 @@ class DatabaseManager:
                 return True
 
             # Convert product_id to Python int
-            if hasattr(product_id, 'item'):
-                product_id = product_id.item()
-            else:
-                product_id = int(product_id)
+            product_id = as_int(product_id)
 
             # Build SET clause
             set_parts = []
@@ -246,11 +487,16 @@ class DatabaseManager:
             for field, value in updates.items():
                 set_parts.append(f"{field} = ?")
                 values.append(value)
+                # Keep the lowercase search copy in sync
+                if field in SEARCH_COLUMNS:
+                    set_parts.append(f"{SEARCH_COLUMNS[field]} = LOWER(?)")
+                    values.append(value)
 
             set_clause = ", ".join(set_parts)
             values.append(product_id)
 
             query = f"UPDATE products SET {set_clause} WHERE id = ?"
+            self._filter_cache.clear()
             self.con.execute(query, values)
 
             # Verify the update actually worked
@@ -265,7 +511,6 @@ class DatabaseManager:
             return True
         except Exception as e:
             print(f"Error updating product {product_id}: {str(e)}")
-            import traceback
             traceback.print_exc()
             return False
 
@@ -284,65 +529,56 @@ class DatabaseManager:
             tuple: (success: bool, message: str)
         """
         try:
-            if hasattr(active_product_id, 'item'):
-                active_product_id = active_product_id.item()
-            else:
-                active_product_id = int(active_product_id)
+            active_product_id = as_int(active_product_id)
 
-            # Get active product
-            active_product = self.get_product_by_id(active_product_id)
-            if active_product is None:
+            # Check the active product exists
+            if self.con.execute(
+                    "SELECT 1 FROM products WHERE id = ?",
+                    [active_product_id]).fetchone() is None:
                 return False, f"Active product {active_product_id} not found"
 
-            # Collect all barcodes
-            all_barcodes = set()
-
-            # Add active product's barcodes
-            if pd.notna(active_product.get('barcode')) and active_product.get('barcode'):
-                for bc in str(active_product['barcode']).split(';'):
-                    bc = bc.strip()
-                    if bc:
-                        all_barcodes.add(bc)
-
-            # Get products to link and collect their barcodes
-            products_df = self.get_products_by_ids(products_to_link)
-
-            for _, row in products_df.iterrows():
-                if pd.notna(row.get('barcode')) and row.get('barcode'):
-                    for bc in str(row['barcode']).split(';'):
-                        bc = bc.strip()
-                        if bc:
-                            all_barcodes.add(bc)
+            # Collect the distinct ';'-separated barcodes of the active and
+            # linked products, sorted, in a single query
+            ids = [active_product_id] + [as_int(p) for p in products_to_link]
+            merged = self.con.execute("""
+                SELECT string_agg(DISTINCT bc, ';' ORDER BY bc)
+                FROM (
+                    SELECT trim(UNNEST(string_split(CAST(barcode AS VARCHAR), ';'))) AS bc
+                    FROM products
+                    WHERE id = ANY(?) AND barcode IS NOT NULL
+                )
+                WHERE bc != ''
+            """, [ids]).fetchone()[0]
 
             # Update active product with merged barcodes
-            merged_barcodes = ";".join(sorted(all_barcodes))
+            merged_barcodes = merged or ""
             self.update_product(active_product_id, {
                                 'barcode': merged_barcodes})
 
-            # Set deleted and linked_items on all linked products
+            # Set deleted and linked_items on all linked products in one statement
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-            for pid in products_to_link:
-                if hasattr(pid, 'item'):
-                    pid = pid.item()
-                else:
-                    pid = int(pid)
-
-                if pid != active_product_id:  # Don't mark the active product as deleted
-                    self.update_product(pid, {
-                        'linked_items': str(active_product_id),
-                        'deleted': timestamp
-                    })
+            linked_ids = [
+                pid for pid in ids[1:]
+                if pid != active_product_id  # Don't mark the active product as deleted
+            ]
+            if linked_ids:
+                self._filter_cache.clear()
+                self.con.execute(
+                    "UPDATE products SET linked_items = ?, deleted = ? WHERE id = ANY(?)",
+                    [str(active_product_id), timestamp, linked_ids]
+                )
+                print(f"Linked products {linked_ids} to {active_product_id}")
 
             # ========== DEBUG: Print all affected rows ==========
-            self._print_link_debug(active_product_id, products_to_link)
+            if DEBUG_DATABASE_WRITES:
+                self._print_link_debug(active_product_id, products_to_link)
             # ====================================================
 
             return True, f"Successfully linked {len(products_to_link)} products to product {active_product_id}"
 
         except Exception as e:
             print(f"Error linking products: {str(e)}")
-            import traceback
             traceback.print_exc()
             return False, f"Error: {str(e)}"
 
@@ -353,16 +589,15 @@ class DatabaseManager:
         print("=" * 80)
 
         # Collect all IDs to query
-        all_ids = set([active_product_id] + [int(pid) if hasattr(pid,
-                      'item') else int(pid) for pid in linked_product_ids])
-        placeholders = ", ".join(["?" for _ in all_ids])
+        all_ids = set([active_product_id] +
+                      [as_int(pid) for pid in linked_product_ids])
 
         # Query the affected rows
-        df = self.con.execute(f"""
+        df = self.con.execute("""
             SELECT id, name_search, brands_search, barcode, active, deleted, linked_items
             FROM products 
-            WHERE id IN ({placeholders})
-        """, list(all_ids)).df()
+            WHERE id = ANY(?)
+        """, [list(all_ids)]).df()
 
         # Print active product
         print("\n📗 ACTIVE PRODUCT (master):")
@@ -384,14 +619,14 @@ class DatabaseManager:
             print(
                 f"\n📕 LINKED PRODUCTS (marked as deleted): {len(linked_rows)} products")
             print("-" * 80)
-            for _, row in linked_rows.iterrows():
-                print(f"\n  ID:           {row['id']}")
-                print(f"  Name:         {row['name_search']}")
-                print(f"  Brand:        {row['brands_search']}")
-                print(f"  Barcode:      {row['barcode']}")
-                print(f"  Active:       {row['active']}")
-                print(f"  Deleted:      {row['deleted']}")
-                print(f"  Linked Items: {row['linked_items']}")
+            for row in linked_rows.itertuples(index=False):
+                print(f"\n  ID:           {row.id}\n"
+                      f"  Name:         {row.name_search}\n"
+                      f"  Brand:        {row.brands_search}\n"
+                      f"  Barcode:      {row.barcode}\n"
+                      f"  Active:       {row.active}\n"
+                      f"  Deleted:      {row.deleted}\n"
+                      f"  Linked Items: {row.linked_items}")
 
         print("\n" + "=" * 80)
         print("END DEBUG")
@@ -409,10 +644,7 @@ class DatabaseManager:
             tuple: (success: bool, message: str)
         """
         try:
-            if hasattr(product_id, 'item'):
-                product_id = product_id.item()
-            else:
-                product_id = int(product_id)
+            product_id = as_int(product_id)
 
             all_updates = updates.copy() if updates else {}
             all_updates['active'] = 1
@@ -421,7 +653,8 @@ class DatabaseManager:
 
             if success:
                 # ========== DEBUG: Print activated product ==========
-                self._print_activate_debug(product_id)
+                if DEBUG_DATABASE_WRITES:
+                    self._print_activate_debug(product_id)
                 # ====================================================
                 return True, f"Product {product_id} has been activated successfully"
             else:
@@ -1,4 +1,5 @@
 import pandas as pd
+import duckdb
 
 # Load CSV
 df = pd.read_csv("view_food_clean.csv")
@@ -41,20 +42,21 @@ print()
 # C. Barcode duplicates (barcodes separated by ';')
 # ------------------------------------------------------
 
-# Expand barcodes into rows
-df_barcodes = (
-    df.assign(barcode=df["barcode"].fillna("").astype(str))
-      .assign(barcode=lambda x: x["barcode"].str.split(";"))
-      .explode("barcode")
-)
+# Expand barcodes into rows and count them in DuckDB (queries df directly),
+# skipping empty barcode entries
+barcode_counts = duckdb.sql("""
+    SELECT barcode, COUNT(*) AS count
+    FROM (
+        SELECT UNNEST(string_split(CAST(barcode AS VARCHAR), ';')) AS barcode
+        FROM df
+        WHERE barcode IS NOT NULL
+    )
+    WHERE trim(barcode) != ''
+    GROUP BY barcode
+    ORDER BY count DESC
+""").df()
 
-# Remove empty barcode entries
-df_barcodes = df_barcodes[df_barcodes["barcode"].str.strip() != ""]
-
-# Count barcode occurrences
-barcode_counts = df_barcodes["barcode"].value_counts()
-
-duplicates = barcode_counts[barcode_counts > 1]
+duplicates = barcode_counts[barcode_counts["count"] > 1]
 
 print("=== Duplicate Barcodes (count > 1) ===")
 print(duplicates)
@@ -1,9 +1,13 @@
 """
 Server logic for the Food Product Similarity Dashboard
 """
+import asyncio
+import time
+from collections import OrderedDict
+import traceback
 from shiny import render, reactive, ui
 from shiny.types import SilentException
-import pandas as pd
+import numpy as np
 from database import DatabaseManager
 from api_client import SimilarityAPIClient
 from ui_components import (
@@ -14,6 +18,7 @@ from ui_components import (
     create_api_warning_card,
     create_no_selection_card,
     create_comparison_panel,
+    create_event_button,
     create_review_card,
     create_editor_form,
     create_success_message,
@@ -38,7 +43,12 @@ def create_server(input, output, session):
     api_client = SimilarityAPIClient(SIMILARITY_API_URL)
 
     # Reactive values
-    similarity_results = reactive.Value({})
+    # Similarity results: one reactive value per product id, so storing the
+    # results of one product only invalidates readers of that product.
+    # Kept in least-recently-used order and capped, so long sessions don't
+    # hold on to every product ever selected.
+    similarity_results = OrderedDict()
+    SIMILARITY_RESULTS_LIMIT = 64
     selected_product_ids = reactive.Value(
         [])  # Original product (from data tab)
 
@@ -61,16 +71,11 @@ def create_server(input, output, session):
     table_refresh_trigger = reactive.Value(0)
 
     # Timestamp-based cooldown to prevent spurious selection after linking/saving
-    import time
     last_reset_time = reactive.Value(0.0)
     SELECTION_COOLDOWN = 1.5  # seconds to ignore selections after reset
 
-    # Track created handlers to avoid duplicates
-    created_handlers = set()
-
-    # Display columns for tables
-    DISPLAY_COLUMNS = ["id", "name_search", "brands_search",
-                       "barcode", "energy", "protein", "fat"]
+    # Search boxes only query the database once typing pauses this long
+    SEARCH_DEBOUNCE = 0.25  # seconds
 
     # ----------------------
     # Navigation
@@ -177,12 +182,48 @@ def create_server(input, output, session):
     # ----------------------
 
     def get_filtered_data(active_status, search_term=""):
-        """Get filtered product data"""
-        return db.get_filtered_products(
-            active_status,
-            search_term=search_term,
-            columns=DISPLAY_COLUMNS
-        )
+        """Get filtered product data (cached by the database until it changes)"""
+        return db.get_filtered_products(active_status, search_term=search_term)
+
+    def debounced_input(read_input, delay):
+        """
+        Follow an input, but only after it has stopped changing for delay seconds
+
+        Args:
+            read_input: Function returning the current input value
+            delay: Quiet period in seconds
+
+        Returns:
+            reactive.Value holding the settled input value
+        """
+        settled = reactive.Value("")
+        state = {"value": None, "changed": 0.0}
+
+        @reactive.Effect
+        def _debounce():
+            value = read_input()
+            now = time.monotonic()
+            if value != state["value"]:
+                state["value"] = value
+                state["changed"] = now
+
+            remaining = delay - (now - state["changed"])
+            if remaining > 0:
+                reactive.invalidate_later(remaining)
+            else:
+                settled.set(value)
+
+        return settled
+
+    def similarity_result_value(product_id):
+        """Get the reactive value holding a product's similarity results (None until computed)"""
+        if product_id in similarity_results:
+            similarity_results.move_to_end(product_id)
+        else:
+            similarity_results[product_id] = reactive.Value(None)
+            if len(similarity_results) > SIMILARITY_RESULTS_LIMIT:
+                similarity_results.popitem(last=False)
+        return similarity_results[product_id]
 
     def get_current_weights():
         """Get current weight values (using defaults)"""
@@ -192,15 +233,22 @@ def create_server(input, output, session):
     # Active Products Table
     # ----------------------
 
+    search_active = debounced_input(
+        lambda: input.search_active() if hasattr(input, 'search_active') else "",
+        SEARCH_DEBOUNCE)
+
+    @reactive.Calc
+    def active_products_data():
+        """Active products for the current search, shared by all readers"""
+        # Depend on refresh trigger to update after DB changes
+        _ = table_refresh_trigger.get()
+        return get_filtered_data("1", search_active.get())
+
     @output
     @render.data_frame
     def active_products_table():
-        # Depend on refresh trigger to update after DB changes
-        _ = table_refresh_trigger.get()
-        search = input.search_active() if hasattr(input, 'search_active') else ""
-        df = get_filtered_data("1", search)
         return render.DataTable(
-            df,
+            active_products_data(),
             selection_mode="none",
             height="70vh",
             width="100%"
@@ -210,15 +258,31 @@ def create_server(input, output, session):
     # Inactive Products Table
     # ----------------------
 
+    search_inactive = debounced_input(
+        lambda: input.search_inactive() if hasattr(input, 'search_inactive') else "",
+        SEARCH_DEBOUNCE)
+
+    @reactive.Calc
+    def inactive_products_data():
+        """Inactive products for the current search, shared by all readers"""
+        # Depend on refresh trigger to update after DB changes
+        _ = table_refresh_trigger.get()
+        return get_filtered_data("0", search_inactive.get())
+
+    @reactive.Calc
+    def inactive_product_ids():
+        """IDs of the rows shown in the inactive products table"""
+        # Taken from the memoized table data, so selections never re-query
+        df = inactive_products_data()
+        if "id" not in df.columns:
+            return np.array([], dtype="int64")
+        return df["id"].to_numpy()
+
     @output
     @render.data_frame
     def inactive_products_table():
-        # Depend on refresh trigger to update after DB changes
-        _ = table_refresh_trigger.get()
-        search = input.search_inactive() if hasattr(input, 'search_inactive') else ""
-        df = get_filtered_data("0", search)
         return render.DataTable(
-            df,
+            inactive_products_data(),
             selection_mode="row",
             height="70vh",
             width="100%"
@@ -254,17 +318,16 @@ def create_server(input, output, session):
                 print(f"DEBUG: Skipping auto-navigation (cooldown active)")
                 return
 
-            search = input.search_inactive() if hasattr(input, 'search_inactive') else ""
-            df = get_filtered_data("0", search)
+            ids = inactive_product_ids()
 
             # Guard against out-of-bounds index
             row_idx = list(sel["rows"])[0]
-            if row_idx >= len(df):
+            if row_idx >= len(ids):
                 print(
-                    f"DEBUG: Row index {row_idx} out of bounds for {len(df)} rows, skipping")
+                    f"DEBUG: Row index {row_idx} out of bounds for {len(ids)} rows, skipping")
                 return
 
-            product_id = int(df.iloc[row_idx]["id"])
+            product_id = int(ids[row_idx])
 
             current_ids = selected_product_ids.get()
             print(f"DEBUG: product_id={product_id}, current_ids={current_ids}")
@@ -288,21 +351,35 @@ def create_server(input, output, session):
             raise
         except Exception as e:
             print(f"Error in inactive selection tracking: {e}")
-            import traceback
             traceback.print_exc()
 
     # ----------------------
     # Compute Similarity
     # ----------------------
 
+    @reactive.extended_task
+    async def similarity_task(product_id, weights):
+        """
+        Fetch similar products from the API
+
+        Runs as an extended task, outside the reactive flush, so a slow API
+        call doesn't hold up reactive processing while it is waiting.
+        """
+        success, result = await asyncio.to_thread(
+            api_client.get_similar_products, product_id, weights)
+        return product_id, result
+
     def compute_similarity(product_id):
-        """Compute similarity for a product using the API"""
-        weights = get_current_weights()
-        success, result = api_client.get_similar_products(product_id, weights)
+        """Start the similarity computation for a product using the API"""
+        similarity_task.invoke(product_id, get_current_weights())
 
-        store = similarity_results.get().copy()
-        store[product_id] = result
-        similarity_results.set(store)
+    @reactive.Effect
+    def _store_similarity_result():
+        """Store the results of a finished similarity task"""
+        if similarity_task.status() != "success":
+            return
+        product_id, result = similarity_task.result()
+        similarity_result_value(product_id).set(result)
 
     # ----------------------
     # Similarity Section UI
@@ -320,80 +397,29 @@ def create_server(input, output, session):
         if not api_client.check_health():
             return create_api_warning_card(SIMILARITY_API_URL)
 
-        pid = ids[0]
-
-        try:
-            product_data = db.get_product_by_id(pid)
-
-            if product_data is None:
-                return ui.card(f"Product with ID {pid} not found.")
-
-            # Get similarity results
-            results = similarity_results.get()
-            results_df = results.get(pid, pd.DataFrame())
-
-            # Get current filters
-            search_term = ""
-            min_score = 0.0
-            try:
-                search_term = input.similarity_search()
-            except:
-                pass
-            try:
-                min_score = input.similarity_score_filter() or 0.0
-            except:
-                pass
-
-            # Apply filters
-            filtered_df = results_df.copy()
-            if not filtered_df.empty and 'Error' not in filtered_df.columns:
-                if search_term:
-                    mask = (
-                        filtered_df['Name'].str.contains(search_term, case=False, na=False) |
-                        filtered_df['Brand'].str.contains(
-                            search_term, case=False, na=False)
-                    )
-                    filtered_df = filtered_df[mask]
-
-                if min_score > 0:
-                    filtered_df['Score_num'] = filtered_df['Score'].astype(
-                        float)
-                    filtered_df = filtered_df[filtered_df['Score_num']
-                                              >= min_score]
-
-            # Build the UI
-            return ui.div(
-                # Results list (now includes inline comparison panels)
-                ui.output_ui("similarity_results_list"),
-            )
+        # The product itself is looked up (together with the expanded
+        # comparison product) in a single query by similarity_results_list
+        return ui.div(
+            # Results list (now includes inline comparison panels)
+            ui.output_ui("similarity_results_list"),
+        )
 
-        except Exception as e:
-            print(f"Error in similarity section: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return ui.card(f"Error loading product: {str(e)}")
+    @reactive.Calc
+    def filtered_similarity_results():
+        """
+        Similarity results of the selected product with the search and score filters applied
 
-    @output
-    @render.ui
-    def similarity_results_list():
-        """Render the list of similar products with Compare buttons and inline comparison panels"""
+        Returns None while results are not computed yet. Error frames are
+        returned unfiltered.
+        """
         ids = selected_product_ids.get()
         if not ids:
-            return ui.div()
-
-        pid = ids[0]
-        results = similarity_results.get()
-
-        if pid not in results:
-            return ui.card("Computing similarity...", class_="p-3")
+            return None
 
-        df = results[pid].copy()
-
-        if 'Error' in df.columns:
-            return ui.card(df.iloc[0]['Error'], class_="alert alert-danger")
-
-        if df.empty:
-            return ui.card("No similar products found.", class_="p-3")
+        # No copy needed: filtering below only creates new frames
+        df = similarity_result_value(ids[0]).get()
+        if df is None or 'Error' in df.columns or df.empty:
+            return df
 
         # Apply filters
         search_term = ""
@@ -416,46 +442,64 @@ def create_server(input, output, session):
             df = df[mask]
 
         if min_score > 0:
-            # Ensure the score is treated as a numeric value for filtering
-            df['Score_num'] = df['Score'].astype(float)
-            df = df[df['Score_num'] >= min_score]
+            df = df[df['Score'] >= min_score]
+
+        return df
+
+    @output
+    @render.ui
+    def similarity_results_list():
+        """Render the list of similar products with Compare buttons and inline comparison panels"""
+        ids = selected_product_ids.get()
+        if not ids:
+            return ui.div()
+
+        pid = ids[0]
+        df = filtered_similarity_results()
+
+        if df is None:
+            return ui.card("Computing similarity...", class_="p-3")
+
+        if 'Error' in df.columns:
+            return ui.card(df['Error'].iat[0], class_="alert alert-danger")
+
+        if similarity_result_value(pid).get().empty:
+            return ui.card("No similar products found.", class_="p-3")
 
         if df.empty:
             return ui.card("No products match your filters.", class_="p-3")
 
+        # Fetch the original product and the expanded one (if any) in one query
+        expanded_id = expanded_comparison_id.get()
+        fetch_ids = [pid]
+        if expanded_id is not None and expanded_id != pid:
+            fetch_ids.append(expanded_id)
+        products_by_id = {
+            int(record['id']): record
+            for record in db.get_products_by_ids(
+                fetch_ids, columns=COMPARISON_FIELDS).to_dict('records')
+        }
+
         # Get original product for comparison
-        original_product = db.get_product_by_id(pid)
-        original_dict = original_product.to_dict() if hasattr(
-            original_product, 'to_dict') else dict(original_product)
+        original_dict = products_by_id.get(int(pid))
+        if original_dict is None:
+            return ui.card(f"Product with ID {pid} not found.")
 
         # Build list of product rows with inline comparison panels
         rows = []
-        expanded_id = expanded_comparison_id.get()
         marked = marked_for_review.get()
 
-        for idx, row in df.iterrows():
-            similar_id = int(row['_id'])
-            is_active = row['Active'] == 'Yes'
+        # Plain tuples of the displayed columns avoid building a Series per row
+        result_rows = df[['_id', 'Rank', 'Name', 'Brand', 'Active', 'Score']]
+        for similar_id, rank, name, brand, active, score in result_rows.itertuples(
+                index=False, name=None):
+            similar_id = int(similar_id)
+            is_active = active == 'Yes'
             is_expanded = expanded_id == similar_id
             is_marked = similar_id in marked
 
-            # Calculate and format the score as a percentage (rounded to 2 digits)
-            score_float = float(row['Score'])
-            formatted_score = f"{round(score_float * 100, 2)}%"
-
-            # Create handler for this row's compare button
-            btn_id = f"compare_btn_{similar_id}"
-            if btn_id not in created_handlers:
-                created_handlers.add(btn_id)
-
-                @reactive.Effect
-                @reactive.event(input[btn_id])
-                def _toggle_compare(sid=similar_id):
-                    current = expanded_comparison_id.get()
-                    if current == sid:
-                        expanded_comparison_id.set(None)
-                    else:
-                        expanded_comparison_id.set(sid)
+            # Format the numeric score as a percentage (rounded to 2 digits)
+            formatted_score = f"{round(score * 100, 2)}%"
 
             # Row styling
             row_class = "p-3 border rounded clickable-row d-flex justify-content-between align-items-center"
@@ -474,9 +518,9 @@ def create_server(input, output, session):
                 ui.div(
                     # First line: Name, Brand, Status Badges
                     ui.div(
-                        ui.strong(f"#{row['Rank']}", class_="me-2"),
-                        ui.strong(row['Name'], class_="me-2"),
-                        ui.strong(f"({row['Brand']})",
+                        ui.strong(f"#{rank}", class_="me-2"),
+                        ui.strong(name, class_="me-2"),
+                        ui.strong(f"({brand})",
                                   class_="text-muted me-2"),
                         ui.span("ACTIVE", class_="badge bg-success me-1") if is_active else ui.span(
                             "INACTIVE", class_="badge bg-secondary me-1"),
@@ -496,8 +540,9 @@ def create_server(input, output, session):
                     ),
                     # Compare Button
                     ui.div(
-                        ui.input_action_button(
-                            btn_id,
+                        create_event_button(
+                            "compare_click",
+                            similar_id,
                             "▲ Close" if is_expanded else "▼ Compare",
                             class_="btn btn-sm btn-outline-primary w-100"
                         ),
@@ -510,62 +555,8 @@ def create_server(input, output, session):
 
             # If this row is expanded, add the comparison panel right below it
             if is_expanded:
-                similar_product = db.get_product_by_id(similar_id)
-                if similar_product is not None:
-                    similar_dict = similar_product.to_dict() if hasattr(
-                        similar_product, 'to_dict') else dict(similar_product)
-
-                    # Create mark/unmark handlers
-                    mark_btn_id = f"mark_btn_{similar_id}"
-                    if mark_btn_id not in created_handlers:
-                        created_handlers.add(mark_btn_id)
-
-                        @reactive.Effect
-                        @reactive.event(input[mark_btn_id])
-                        def _mark_product(sid=similar_id):
-                            marked = marked_for_review.get().copy()
-
-                            # Also add original product if not already there
-                            orig_ids = selected_product_ids.get()
-                            if orig_ids:
-                                orig_id = orig_ids[0]
-                                if orig_id not in marked:
-                                    orig_product = db.get_product_by_id(
-                                        orig_id)
-                                    if orig_product is not None:
-                                        marked[orig_id] = {
-                                            'data': orig_product.to_dict() if hasattr(orig_product, 'to_dict') else dict(orig_product),
-                                            'is_original': True,
-                                            'is_active': orig_product.get('active', 0) == 1
-                                        }
-
-                            # Add similar product
-                            similar_prod = db.get_product_by_id(sid)
-                            if similar_prod is not None:
-                                marked[sid] = {
-                                    'data': similar_prod.to_dict() if hasattr(similar_prod, 'to_dict') else dict(similar_prod),
-                                    'is_original': False,
-                                    'is_active': similar_prod.get('active', 0) == 1
-                                }
-
-                            marked_for_review.set(marked)
-                            print(
-                                f"Marked product {sid} for review. Total marked: {len(marked)}")
-
-                    unmark_btn_id = f"unmark_btn_{similar_id}"
-                    if unmark_btn_id not in created_handlers:
-                        created_handlers.add(unmark_btn_id)
-
-                        @reactive.Effect
-                        @reactive.event(input[unmark_btn_id])
-                        def _unmark_product(sid=similar_id):
-                            marked = marked_for_review.get().copy()
-                            if sid in marked:
-                                del marked[sid]
-                                marked_for_review.set(marked)
-                                print(
-                                    f"Unmarked product {sid}. Total marked: {len(marked)}")
-
+                similar_dict = products_by_id.get(similar_id)
+                if similar_dict is not None:
                     comparison_ui = create_comparison_panel(
                         original_dict, similar_dict, COMPARISON_FIELDS, is_marked, similar_id)
 
@@ -586,6 +577,59 @@ def create_server(input, output, session):
             *rows
         )
 
+    @reactive.Effect
+    @reactive.event(input.compare_click)
+    def _toggle_compare():
+        """Expand or collapse the comparison panel of the clicked row"""
+        sid = int(input.compare_click())
+        if expanded_comparison_id.get() == sid:
+            expanded_comparison_id.set(None)
+        else:
+            expanded_comparison_id.set(sid)
+
+    @reactive.Effect
+    @reactive.event(input.mark_click)
+    def _mark_product():
+        """Mark the clicked similar product (and the original) for review"""
+        sid = int(input.mark_click())
+        marked = marked_for_review.get().copy()
+
+        # Also add original product if not already there
+        orig_ids = selected_product_ids.get()
+        if orig_ids:
+            orig_id = orig_ids[0]
+            if orig_id not in marked:
+                orig_product = db.get_product_by_id(orig_id)
+                if orig_product is not None:
+                    marked[orig_id] = {
+                        'data': orig_product.to_dict() if hasattr(orig_product, 'to_dict') else dict(orig_product),
+                        'is_original': True,
+                        'is_active': orig_product.get('active', 0) == 1
+                    }
+
+        # Add similar product
+        similar_prod = db.get_product_by_id(sid)
+        if similar_prod is not None:
+            marked[sid] = {
+                'data': similar_prod.to_dict() if hasattr(similar_prod, 'to_dict') else dict(similar_prod),
+                'is_original': False,
+                'is_active': similar_prod.get('active', 0) == 1
+            }
+
+        marked_for_review.set(marked)
+        print(f"Marked product {sid} for review. Total marked: {len(marked)}")
+
+    @reactive.Effect
+    @reactive.event(input.unmark_click)
+    def _unmark_product():
+        """Remove the clicked similar product from review"""
+        sid = int(input.unmark_click())
+        marked = marked_for_review.get().copy()
+        if sid in marked:
+            del marked[sid]
+            marked_for_review.set(marked)
+            print(f"Unmarked product {sid}. Total marked: {len(marked)}")
+
     # ----------------------
     # Go to Review Button Handler
     # ----------------------
@@ -710,20 +754,6 @@ def create_server(input, output, session):
         elif is_active:
             card_class += " border-success border-2"
 
-        # Create remove handler
-        remove_btn_id = f"remove_review_{pid}"
-        if remove_btn_id not in created_handlers:
-            created_handlers.add(remove_btn_id)
-
-            @reactive.Effect
-            @reactive.event(input[remove_btn_id])
-            def _remove(remove_pid=pid):
-                marked = marked_for_review.get().copy()
-                if remove_pid in marked:
-                    del marked[remove_pid]
-                    marked_for_review.set(marked)
-                    print(f"Removed product {remove_pid} from review")
-
         badges = []
         if is_original:
             badges.append(ui.span("ORIGINAL", class_="badge bg-primary me-1"))
@@ -749,8 +779,9 @@ def create_server(input, output, session):
                 ),
                 class_="flex-grow-1"
             ),
-            ui.input_action_button(
-                remove_btn_id,
+            create_event_button(
+                "remove_review_click",
+                pid,
                 "✕ Remove",
                 class_="btn btn-sm btn-outline-danger"
             ) if not is_original else "",
@@ -758,6 +789,17 @@ def create_server(input, output, session):
             style="display: flex; align-items: center;"
         )
 
+    @reactive.Effect
+    @reactive.event(input.remove_review_click)
+    def _remove_from_review():
+        """Remove the clicked product from review"""
+        remove_pid = int(input.remove_review_click())
+        marked = marked_for_review.get().copy()
+        if remove_pid in marked:
+            del marked[remove_pid]
+            marked_for_review.set(marked)
+            print(f"Removed product {remove_pid} from review")
+
     @reactive.Effect
     @reactive.event(input.go_to_similarity_from_review)
     def _go_to_similarity():
@@ -826,6 +868,8 @@ def create_server(input, output, session):
                 selected_product_ids.set([])
                 marked_for_review.set({})
                 table_refresh_trigger.set(table_refresh_trigger.get() + 1)
+                # Cached similarity results still show the old names/active flags
+                api_client.clear_cache()
                 # Set cooldown to prevent spurious selection after table refresh
                 last_reset_time.set(time.time())
                 # Navigate to data tab
@@ -849,6 +893,8 @@ def create_server(input, output, session):
                 # Clear marked products and refresh tables
                 marked_for_review.set({})
                 table_refresh_trigger.set(table_refresh_trigger.get() + 1)
+                # Cached similarity results still show the old names/active flags
+                api_client.clear_cache()
             else:
                 status_message.set({'type': 'error', 'text': message})
 
@@ -980,6 +1026,8 @@ def create_server(input, output, session):
             selected_product_ids.set([])
             marked_for_review.set({})  # Clear marked products
             table_refresh_trigger.set(table_refresh_trigger.get() + 1)
+            # Cached similarity results still show the old names/active flags
+            api_client.clear_cache()
             # Set cooldown to prevent spurious selection after table refresh
             last_reset_time.set(time.time())
             # Go back to data tab
@@ -993,5 +1041,6 @@ def create_server(input, output, session):
 
     @reactive.Effect
     def _cleanup():
-        """Cleanup database connection on session end"""
+        """Cleanup database connection and API client on session end"""
         session.on_ended(lambda: db.close())
+        session.on_ended(lambda: api_client.close())
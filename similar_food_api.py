@@ -3,9 +3,11 @@ from flask import Flask, request, jsonify
 import pandas as pd
 import numpy as np
 import re
+import time
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-import os
+from sklearn.preprocessing import normalize
+import duckdb
+from database import CSV_PATH, PARQUET_PATH, product_source
 
 app = Flask(__name__)
 
@@ -18,22 +20,38 @@ print("🔄 Loading model and data at startup...")
 MODEL = SentenceTransformer("all-MiniLM-L6-v2")
 print("✅ Model loaded")
 
-# Load and preprocess data ONCE
-CSV_PATH = os.path.join(os.path.dirname(__file__), "view_food_clean.csv")
-df = pd.read_csv(CSV_PATH, low_memory=False)
+# Nutrition columns (used in similarity calculation)
+NUTRITION_COLS = ["energy", "carbohydrates", "fat", "protein",
+                  "saturated_fatty_acid", "sugar", "salt"]
+
+# Load and preprocess data ONCE, from the same Parquet copy of the CSV that
+# the dashboard uses (created here if the dashboard has not run yet, or the
+# CSV itself if the copy cannot be written).
+# Only the columns the API reads are loaded, and deleted items are filtered
+# out before they reach pandas.
+API_COLS = ["id", "name_search", "brands_search", "barcode", "categories",
+            "active"] + NUTRITION_COLS
+with duckdb.connect() as con:
+    df = con.execute(f"""
+        SELECT {", ".join(API_COLS)}
+        FROM {product_source(con, CSV_PATH, PARQUET_PATH)}
+        WHERE deleted IS NULL
+    """).df()
 
 # Convert active to numeric
 df["active"] = pd.to_numeric(df["active"], errors="coerce")
 
-# Filter out deleted items
-df = df[df["deleted"].isna()]
-
-# Nutrition columns (used in similarity calculation)
-NUTRITION_COLS = ["energy", "carbohydrates", "fat", "protein",
-                  "saturated_fatty_acid", "sugar", "salt"]
+# Plain int64 ids, so id comparisons and lookups run on a numeric array
+df["id"] = df["id"].astype("int64")
 
 print(f"✅ Data loaded: {len(df)} total products")
 
+# Product id -> row position in df, so lookups don't scan the whole frame.
+# Built in reverse so the first row wins if an id is duplicated.
+ID_TO_POSITION = {
+    pid: pos for pos, pid in reversed(list(enumerate(df["id"].tolist())))
+}
+
 # ============================================================
 # Text cleaning function
 # ============================================================
@@ -53,21 +71,164 @@ def clean_text(text):
 # Precompute ALL product embeddings (both active and inactive)
 # ============================================================
 print("🔄 Precomputing embeddings for all products...")
-ALL_DF = df.copy()
-ALL_DF["text_combined"] = (
-    ALL_DF["name_search"].apply(clean_text) + " " +
-    ALL_DF["brands_search"].apply(clean_text)
+text_combined = (
+    df["name_search"].apply(clean_text) + " " +
+    df["brands_search"].apply(clean_text)
 )
-ALL_EMBEDDINGS = MODEL.encode(
-    ALL_DF["text_combined"].tolist(),
+# Stored L2-normalized, so cosine similarity is a single matrix-vector product
+ALL_EMBEDDINGS = normalize(MODEL.encode(
+    text_combined.tolist(),
     convert_to_numpy=True,
     show_progress_bar=True
-)
-print(f"✅ Embeddings computed for {len(ALL_DF)} products")
+))
+print(f"✅ Embeddings computed for {len(df)} products")
+
+# Only the columns used for scoring and the response payload, so per-request
+# comparison frames don't drag along every CSV column
+FEATURE_DF = df[["id", "name_search", "brands_search", "barcode", "active"]
+                + NUTRITION_COLS]
+FEATURE_IDS = FEATURE_DF["id"].to_numpy()
+# Nutrition values for scoring as one float32 matrix (missing values as 0),
+# half the size of the float64 columns and ready for vectorized math
+NUTRITION_MATRIX = FEATURE_DF[NUTRITION_COLS].fillna(0).to_numpy(dtype=np.float32)
+# Match keys for brand and barcode, cleaned once instead of on every request.
+# Empty values get None, which never matches.
+BRAND_KEYS = np.array(
+    [clean_text(str(b)) if b else None for b in FEATURE_DF["brands_search"]],
+    dtype=object)
+BARCODE_KEYS = np.array(
+    [str(bc) if bc else None for bc in FEATURE_DF["barcode"]],
+    dtype=object)
 print("=" * 60)
 print("🚀 API ready to accept requests!")
 print("=" * 60)
 
+# ============================================================
+# Similarity computation
+# ============================================================
+
+
+def find_product_row(product_id):
+    """Return the row of a product by id, or None if it does not exist"""
+    pos = ID_TO_POSITION.get(product_id)
+    if pos is None:
+        return None
+    return df.iloc[pos]
+
+
+def parse_weights(weights):
+    """Read the four similarity weights, falling back to defaults"""
+    return (
+        float(weights.get("text", 0.8)),
+        float(weights.get("nutrition", 0.0)),
+        float(weights.get("brand", 0.1)),
+        float(weights.get("barcode", 0.1))
+    )
+
+
+def describe_product(product_id, row):
+    """Build the JSON summary of a query product"""
+    return {
+        "id": int(product_id),
+        "name": str(row.get("name_search", "")),
+        "brand": str(row.get("brands_search", "")),
+        "barcode": str(row.get("barcode", "")),
+        "active": int(row["active"]) if pd.notna(row["active"]) else 0,
+        "nutrition": {
+            col: float(row[col]) if pd.notna(row[col]) else None
+            for col in NUTRITION_COLS
+        }
+    }
+
+
+def compute_similar_products(product_id, query_row, top_n, w_text, w_nutrition, w_brand, w_barcode):
+    """
+    Score every other product against the query product
+
+    Returns:
+        list of dicts for the top N most similar products
+    """
+    # Compare against all products except the query product. Scores are
+    # computed over the precomputed arrays and masked afterwards, so no
+    # per-request copies of the catalog are made.
+    comparison_mask = FEATURE_IDS != product_id
+    comparison_positions = np.flatnonzero(comparison_mask)
+
+    # ========================================
+    # 1. Text Similarity
+    # ========================================
+    text = (
+        clean_text(str(query_row.get("name_search", ""))) + " " +
+        clean_text(str(query_row.get("brands_search", "")))
+    )
+    text_emb = normalize(MODEL.encode([text], convert_to_numpy=True))[0]
+    text_sim = (ALL_EMBEDDINGS @ text_emb)[comparison_mask]
+
+    # ========================================
+    # 2. Nutrition Similarity
+    # ========================================
+    nutrition_sim = np.zeros(len(comparison_positions))
+    nutrition_values = query_row[NUTRITION_COLS].values.astype(float)
+
+    if not np.all(np.isnan(nutrition_values)):
+        valid_cols = ~np.isnan(nutrition_values)
+        diff = NUTRITION_MATRIX[:, valid_cols] - \
+            nutrition_values[valid_cols].astype(np.float32)
+        nutrition_sim = -np.abs(diff).sum(axis=1)[comparison_mask]
+        nutrition_sim /= np.sum(valid_cols)
+        # Normalize to 0-1 range (simple min-max)
+        if nutrition_sim.max() != nutrition_sim.min():
+            nutrition_sim = (nutrition_sim - nutrition_sim.min()) / \
+                (nutrition_sim.max() - nutrition_sim.min())
+
+    # ========================================
+    # 3. Brand Match
+    # ========================================
+    query_brand = clean_text(query_row.get("brands_search", ""))
+    brand_sim = (BRAND_KEYS[comparison_mask] == query_brand).astype(float)
+
+    # ========================================
+    # 4. Barcode Match
+    # ========================================
+    query_barcode = str(query_row.get("barcode", ""))
+    barcode_sim = (BARCODE_KEYS[comparison_mask] == query_barcode).astype(float)
+
+    # ========================================
+    # 5. Combine Scores
+    # ========================================
+    combined_score = (
+        w_text * text_sim +
+        w_nutrition * nutrition_sim +
+        w_brand * brand_sim +
+        w_barcode * barcode_sim
+    )
+
+    # Get top N
+    top_idx = combined_score.argsort()[::-1][:top_n]
+    top_rows = FEATURE_DF.iloc[comparison_positions[top_idx]]
+    scores = combined_score[top_idx].tolist()
+
+    # Build detailed results
+    similar_products = []
+    for idx, ((_, prod_row), score) in enumerate(zip(top_rows.iterrows(), scores)):
+        prod_id = prod_row["id"]
+        similar_products.append({
+            "rank": idx + 1,
+            "id": int(prod_id),
+            "name": str(prod_row.get("name_search", "")),
+            "brand": str(prod_row.get("brands_search", "")),
+            "barcode": str(prod_row.get("barcode", "")),
+            "active": int(prod_row["active"]) if pd.notna(prod_row["active"]) else 0,
+            "similarity_score": float(score),
+            "nutrition": {
+                col: float(prod_row[col]) if pd.notna(prod_row[col]) else None
+                for col in NUTRITION_COLS
+            }
+        })
+
+    return similar_products
+
+
 # ============================================================
 # API ENDPOINTS
 # ============================================================
@@ -80,12 +241,13 @@ def index():
         "service": "Food Product Similarity API",
         "status": "running",
         "total_products": len(df),
-        "active_products": len(df[df["active"] == 1]),
-        "inactive_products": len(df[df["active"] == 0]),
+        "active_products": int((df["active"] == 1).sum()),
+        "inactive_products": int((df["active"] == 0).sum()),
         "model": "all-MiniLM-L6-v2",
         "endpoints": {
             "/": "Health check (this page)",
             "/similar": "POST - Find similar products",
+            "/batch": "POST - Find similar products for several products",
             "/product/<id>": "GET - Get product details",
             "/stats": "GET - Get dataset statistics"
         }
@@ -117,7 +279,6 @@ def find_similar():
       "computation_time_ms": 123
     }
     """
-    import time
     start_time = time.time()
 
     # Parse request
@@ -132,11 +293,8 @@ def find_similar():
 
     # Optional parameters with defaults
     top_n = int(data.get("top_n", 20))
-    weights = data.get("weights", {})
-    w_text = float(weights.get("text", 0.8))
-    w_nutrition = float(weights.get("nutrition", 0.0))
-    w_brand = float(weights.get("brand", 0.1))
-    w_barcode = float(weights.get("barcode", 0.1))
+    w_text, w_nutrition, w_brand, w_barcode = parse_weights(
+        data.get("weights", {}))
 
     # Validate weights sum to ~1.0
     total_weight = w_text + w_nutrition + w_brand + w_barcode
@@ -146,114 +304,20 @@ def find_similar():
         }), 400
 
     # Get the query product
-    rowset = df[df["id"] == product_id]
-    if rowset.empty:
+    query_row = find_product_row(product_id)
+    if query_row is None:
         return jsonify({
             "error": f"No product found with ID {product_id}"
         }), 404
 
-    query_row = rowset.iloc[0]
-
-    # Create comparison dataframe (all products except the query product)
-    COMPARISON_DF = ALL_DF[ALL_DF["id"] != product_id].copy()
-    comparison_embeddings = ALL_EMBEDDINGS[ALL_DF["id"] != product_id]
-
-    # ========================================
-    # 1. Text Similarity
-    # ========================================
-    text = (
-        clean_text(str(query_row.get("name_search", ""))) + " " +
-        clean_text(str(query_row.get("brands_search", "")))
-    )
-    text_emb = MODEL.encode([text], convert_to_numpy=True)
-    text_sim = cosine_similarity(text_emb, comparison_embeddings).flatten()
-
-    # ========================================
-    # 2. Nutrition Similarity
-    # ========================================
-    nutrition_sim = np.zeros(len(COMPARISON_DF))
-    nutrition_values = query_row[NUTRITION_COLS].values.astype(float)
-
-    if not np.all(np.isnan(nutrition_values)):
-        valid_cols = ~np.isnan(nutrition_values)
-        for i, col in enumerate(NUTRITION_COLS):
-            if valid_cols[i]:
-                diff = COMPARISON_DF[col].fillna(
-                    0).values - nutrition_values[i]
-                nutrition_sim += -np.abs(diff)
-        nutrition_sim /= np.sum(valid_cols)
-        # Normalize to 0-1 range (simple min-max)
-        if nutrition_sim.max() != nutrition_sim.min():
-            nutrition_sim = (nutrition_sim - nutrition_sim.min()) / \
-                (nutrition_sim.max() - nutrition_sim.min())
-
-    # ========================================
-    # 3. Brand Match
-    # ========================================
-    brand_sim = np.array([
-        1.0 if clean_text(query_row.get("brands_search", "")) ==
-        clean_text(str(b)) and b else 0.0
-        for b in COMPARISON_DF["brands_search"]
-    ])
-
-    # ========================================
-    # 4. Barcode Match
-    # ========================================
-    barcode_sim = np.array([
-        1.0 if str(query_row.get("barcode", "")
-                   ) == str(bc) and bc else 0.0
-        for bc in COMPARISON_DF["barcode"]
-    ])
-
-    # ========================================
-    # 5. Combine Scores
-    # ========================================
-    combined_score = (
-        w_text * text_sim +
-        w_nutrition * nutrition_sim +
-        w_brand * brand_sim +
-        w_barcode * barcode_sim
-    )
-
-    # Get top N
-    top_idx = combined_score.argsort()[::-1][:top_n]
-    result_ids = COMPARISON_DF.iloc[top_idx]["id"].tolist()
-    scores = combined_score[top_idx].tolist()
-
-    # Build detailed results
-    similar_products = []
-    for idx, (prod_id, score) in enumerate(zip(result_ids, scores)):
-        prod_row = COMPARISON_DF[COMPARISON_DF["id"] == prod_id].iloc[0]
-        similar_products.append({
-            "rank": idx + 1,
-            "id": int(prod_id),
-            "name": str(prod_row.get("name_search", "")),
-            "brand": str(prod_row.get("brands_search", "")),
-            "barcode": str(prod_row.get("barcode", "")),
-            "active": int(prod_row["active"]) if pd.notna(prod_row["active"]) else 0,
-            "similarity_score": float(score),
-            "nutrition": {
-                col: float(prod_row[col]) if pd.notna(prod_row[col]) else None
-                for col in NUTRITION_COLS
-            }
-        })
+    similar_products = compute_similar_products(
+        product_id, query_row, top_n, w_text, w_nutrition, w_brand, w_barcode)
 
     # Computation time
     computation_time = (time.time() - start_time) * 1000  # ms
 
     return jsonify({
-        "query_product": {
-            "id": int(product_id),
-            "name": str(query_row.get("name_search", "")),
-            "brand": str(query_row.get("brands_search", "")),
-            "barcode": str(query_row.get("barcode", "")),
-            "active": int(query_row["active"]) if pd.notna(query_row["active"]) else 0,
-            "nutrition": {
-                col: float(query_row[col]) if pd.notna(
-                    query_row[col]) else None
-                for col in NUTRITION_COLS
-            }
-        },
+        "query_product": describe_product(product_id, query_row),
         "similar_products": similar_products,
         "parameters": {
             "top_n": top_n,
@@ -268,15 +332,83 @@ def find_similar():
     })
 
 
+@app.route("/batch", methods=["POST"])
+def find_similar_batch():
+    """
+    Find similar products for several products in a single request.
+
+    Expects JSON like:
+    {
+      "items": [{"product_id": 26585, "top_n": 20}, ...],
+      "weights": {"text": 0.8, "nutrition": 0.0, "brand": 0.1, "barcode": 0.1}
+    }
+
+    Returns:
+    {
+      "results": [{"product_id": 26585, "similar_products": [...]}, ...],
+      "computation_time_ms": 123
+    }
+
+    Items whose product is not found carry an "error" instead of results.
+    """
+    start_time = time.time()
+
+    data = request.get_json()
+    if data is None:
+        return jsonify({"error": "No JSON body provided"}), 400
+
+    items = data.get("items")
+    if not isinstance(items, list):
+        return jsonify({"error": "Missing or invalid 'items'"}), 400
+
+    w_text, w_nutrition, w_brand, w_barcode = parse_weights(
+        data.get("weights", {}))
+
+    total_weight = w_text + w_nutrition + w_brand + w_barcode
+    if not (0.99 <= total_weight <= 1.01):
+        return jsonify({
+            "error": f"Weights must sum to 1.0, got {total_weight}"
+        }), 400
+
+    results = []
+    for item in items:
+        try:
+            product_id = int(item["product_id"])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "Missing or invalid 'product_id' in items"}), 400
+
+        query_row = find_product_row(product_id)
+        if query_row is None:
+            results.append({
+                "product_id": product_id,
+                "error": f"No product found with ID {product_id}"
+            })
+            continue
+
+        top_n = int(item.get("top_n", 20))
+        results.append({
+            "product_id": product_id,
+            "similar_products": compute_similar_products(
+                product_id, query_row, top_n,
+                w_text, w_nutrition, w_brand, w_barcode)
+        })
+
+    computation_time = (time.time() - start_time) * 1000  # ms
+
+    return jsonify({
+        "results": results,
+        "computation_time_ms": round(computation_time, 2)
+    })
+
+
 @app.route("/product/<int:product_id>", methods=["GET"])
 def get_product(product_id):
     """Get details of a specific product"""
-    product = df[df["id"] == product_id]
+    row = find_product_row(product_id)
 
-    if product.empty:
+    if row is None:
         return jsonify({"error": f"Product {product_id} not found"}), 404
 
-    row = product.iloc[0]
     return jsonify({
         "id": int(product_id),
         "name": str(row.get("name_search", "")),
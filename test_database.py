@@ -0,0 +1,64 @@
+"""
+Tests for loading the product CSV (run with: python -m unittest test_database)
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+import duckdb
+from config import CSV_COLUMN_TYPES
+from database import ensure_parquet, product_source, sql_path
+
+CSV_HEADER = ("id,name_search,brands_search,categories,barcode,energy,protein,fat,"
+              "saturated_fatty_acid,carbohydrates,sugar,salt,active,deleted,linked_items\n")
+
+
+class MalformedRowTest(unittest.TestCase):
+    """A cell that does not fit its column type must not drop the whole file"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp_dir.name, "products.csv")
+        self.parquet_path = os.path.join(self.tmp_dir.name, "products.parquet")
+        with open(self.csv_path, "w") as f:
+            f.write(CSV_HEADER)
+            f.write("1,apple juice,fruitco,drinks,0123,45,0.2,0,0,10.5,9,0.01,1,,\n")
+            f.write("2,orange juice,fruitco,drinks,0124,n/a,0.3,0.1,0,11,10,0.02,true,,\n")
+            f.write("3,tomato soup,soupco,soup,0125,80,2,3.5,0.5,8,5,0.8,0,,\n")
+        self.con = duckdb.connect()
+
+    def tearDown(self):
+        self.con.close()
+        self.tmp_dir.cleanup()
+
+    def test_parquet_keeps_all_rows(self):
+        self.assertTrue(ensure_parquet(self.con, self.csv_path, self.parquet_path))
+        rows = self.con.execute(f"""
+            SELECT id, barcode, energy, active
+            FROM read_parquet('{sql_path(self.parquet_path)}') ORDER BY id
+        """).fetchall()
+        self.assertEqual(rows, [(1, "0123", 45.0, 1),
+                                (2, "0124", None, None),
+                                (3, "0125", 80.0, 0)])
+
+    def test_parquet_has_configured_types(self):
+        ensure_parquet(self.con, self.csv_path, self.parquet_path)
+        schema = self.con.execute(
+            f"DESCRIBE SELECT * FROM read_parquet('{sql_path(self.parquet_path)}')"
+        ).fetchall()
+        for col, col_type, *_ in schema:
+            self.assertEqual(col_type, CSV_COLUMN_TYPES[col], col)
+
+    def test_csv_fallback_keeps_all_rows(self):
+        # Read-only directory: the Parquet copy cannot be written
+        read_only = OSError(30, "Read-only file system")
+        with mock.patch("tempfile.mkstemp", side_effect=read_only):
+            source = product_source(self.con, self.csv_path, self.parquet_path)
+
+        self.assertFalse(os.path.exists(self.parquet_path))
+        count = self.con.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+        self.assertEqual(count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -352,6 +352,30 @@ def create_product_card(product_id, product_data):
     )
 
 
+def create_event_button(event_id, value, label, class_=""):
+    """
+    Create a button that reports its value through a single shared input
+
+    Clicking sets input[event_id] to value, so one server-side effect can
+    handle every button of this kind instead of one handler per button.
+
+    Args:
+        event_id: Name of the shared Shiny input
+        value: Value sent when the button is clicked (e.g. a product ID)
+        label: Button label
+        class_: CSS classes for the button
+
+    Returns:
+        Shiny UI button tag
+    """
+    return ui.tags.button(
+        label,
+        type="button",
+        class_=class_,
+        onclick=f"Shiny.setInputValue('{event_id}', {value}, {{priority: 'event'}})"
+    )
+
+
 def create_comparison_panel(original_product, similar_product, comparison_fields, is_marked=False, similar_id=None):
     """
     Create a comparison panel showing two products side by side
@@ -361,7 +385,7 @@ def create_comparison_panel(original_product, similar_product, comparison_fields
         similar_product: Similar product data (Series or dict)
         comparison_fields: List of fields to compare
         is_marked: Whether this product is already marked for review
-        similar_id: ID of the similar product (for button IDs)
+        similar_id: ID of the similar product (sent by the mark/unmark buttons)
 
     Returns:
         Shiny UI component
@@ -399,16 +423,18 @@ def create_comparison_panel(original_product, similar_product, comparison_fields
 
     # Create appropriate button based on marked status
     if is_marked:
-        action_button = ui.input_action_button(
-            f"unmark_btn_{similar_id}",
+        action_button = create_event_button(
+            "unmark_click",
+            similar_id,
             "✕ Remove from Review",
             class_="btn btn-outline-danger mt-3"
         )
         status_badge = ui.span("✓ MARKED FOR REVIEW",
                                class_="badge bg-primary ms-2")
     else:
-        action_button = ui.input_action_button(
-            f"mark_btn_{similar_id}",
+        action_button = create_event_button(
+            "mark_click",
+            similar_id,
             "Mark for Review",
             class_="btn btn-primary mt-3"
         )